@@ -4,7 +4,7 @@
 # See top-level LICENSE file for more information
 
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, Set, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Set, Tuple
 
 # WARNING: do not import unnecessary things here to keep cli startup time under
 # control
@@ -30,37 +30,28 @@ class StepOption(click.ParamType):
     def convert(self, value, param, ctx):  # type: (...) -> Set[CompressionStep]
         from swh.graph.webgraph import COMP_SEQ, CompressionStep  # noqa
 
-        steps: Set[CompressionStep] = set()
-
-        specs = value.split(",")
-        for spec in specs:
+        def parse_step(spec: str) -> "CompressionStep":
+            """parse a single step, as an integer or a step name"""
+            try:
+                return CompressionStep(int(spec))
+            except ValueError:
+                pass
+            try:
+                return CompressionStep[spec.upper()]
+            except KeyError:
+                self.fail(f"invalid step specification: {value}, " f"see --help")
+
+        steps: List[CompressionStep] = []
+        for spec in value.split(","):
             if "-" in spec:  # step range
                 (raw_l, raw_r) = spec.split("-", maxsplit=1)
-                if raw_l == "":  # no left endpoint
-                    raw_l = COMP_SEQ[0].name
-                if raw_r == "":  # no right endpoint
-                    raw_r = COMP_SEQ[-1].name
-                l_step = self.convert(raw_l, param, ctx)
-                r_step = self.convert(raw_r, param, ctx)
-                if len(l_step) != 1 or len(r_step) != 1:
-                    self.fail(f"invalid step specification: {value}, " f"see --help")
-                l_idx = l_step.pop()
-                r_idx = r_step.pop()
-                steps = steps.union(
-                    set(CompressionStep(i) for i in range(l_idx.value, r_idx.value + 1))
-                )
+                l_step = parse_step(raw_l) if raw_l else COMP_SEQ[0]
+                r_step = parse_step(raw_r) if raw_r else COMP_SEQ[-1]
+                steps.extend(COMP_SEQ[l_step.value - 1 : r_step.value])
             else:  # singleton step
-                try:
-                    steps.add(CompressionStep(int(spec)))  # integer step
-                except ValueError:
-                    try:
-                        steps.add(CompressionStep[spec.upper()])  # step name
-                    except KeyError:
-                        self.fail(
-                            f"invalid step specification: {value}, " f"see --help"
-                        )
-
-        return steps
+                steps.append(parse_step(spec))
+
+        return set(steps)
 
 
 class PathlibPath(click.Path):
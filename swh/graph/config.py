@@ -3,13 +3,19 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import functools
+import importlib.resources
 import logging
+import os
 from pathlib import Path
+import re
+import shutil
 import sys
 
 import psutil
 
 
+@functools.lru_cache()
 def find_graph_jar():
     """find swh-graph.jar, containing the Java part of swh-graph
 
@@ -35,35 +41,76 @@ def find_graph_jar():
     raise RuntimeError("swh-graph JAR not found. Have you run `make java`?")
 
 
+def parse_ram(size) -> int:
+    """parse a RAM size as an integer number of bytes, given either as plain
+    bytes or with a JVM-style case-insensitive K/M/G/T binary suffix (e.g.,
+    "200G"), as accepted by the -Xmx option"""
+    match = re.fullmatch(r"(\d+)\s*([kmgtKMGT]?)", str(size).strip())
+    if match is None:
+        raise ValueError(
+            f"invalid RAM size: {size!r} "
+            "(expected a number of bytes, or a K/M/G/T suffixed size like 200G)"
+        )
+    multipliers = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+    return int(match.group(1)) * multipliers[match.group(2).lower()]
+
+
 def check_config(conf):
     """check configuration and propagate defaults"""
     conf = conf.copy()
-    if "batch_size" not in conf:
-        # Use 0.1% of the RAM as a batch size:
-        # ~1 billion for big servers, ~10 million for small desktop machines
-        conf["batch_size"] = min(int(psutil.virtual_memory().total / 1000), 2**30 - 1)
+    if "max_parallel_steps" not in conf:
+        conf["max_parallel_steps"] = 1
     if "llp_gammas" not in conf:
         conf["llp_gammas"] = "-0,-1,-2,-3,-4"
-    if "max_ram" not in conf:
-        conf["max_ram"] = str(int(psutil.virtual_memory().total * 0.9))
-    if "java_tool_options" not in conf:
-        conf["java_tool_options"] = " ".join(
-            [
-                "-Xmx{max_ram}",
-                "-XX:PretenureSizeThreshold=512M",
-                "-XX:MaxNewSize=4G",
-                "-XX:+UseLargePages",
-                "-XX:+UseTransparentHugePages",
-                "-XX:+UseNUMA",
-                "-XX:+UseTLAB",
-                "-XX:+ResizeTLAB",
-            ]
+    explicit_max_ram = "max_ram" in conf
+    if not explicit_max_ram:
+        # each concurrently running step gets its own JVM sized with
+        # -Xmx{max_ram}, so share the available memory between them
+        conf["max_ram"] = str(
+            int(psutil.virtual_memory().total * 0.9) // int(conf["max_parallel_steps"])
         )
+    if "batch_size" not in conf:
+        # Use 0.1% of the RAM allotted to each step as a batch size:
+        # ~1 billion arcs for big servers, ~10 million for small desktop
+        # machines; clamped to stay within webgraph's int batch indexing
+        conf["batch_size"] = max(
+            10**6, min(parse_ram(conf["max_ram"]) // 1000, 2**30 - 1)
+        )
+    if "java_tool_options" not in conf:
+        gc_threads = psutil.cpu_count(logical=False) or psutil.cpu_count() or 1
+        java_tool_options = [
+            "-Xmx{max_ram}",
+            f"-XX:ParallelGCThreads={gc_threads}",
+            "-XX:PretenureSizeThreshold=512M",
+            "-XX:MaxNewSize=4G",
+            "-XX:+UseLargePages",
+            "-XX:+UseTransparentHugePages",
+            "-XX:LargePageSizeInBytes=2m",
+            "-XX:+UseNUMA",
+            "-XX:+UseTLAB",
+            "-XX:+ResizeTLAB",
+        ]
+        if explicit_max_ram:
+            # -Xms == -Xmx plus AlwaysPreTouch commits and faults in the
+            # whole heap at JVM startup, using all GC threads in parallel,
+            # instead of serially on first touch in the middle of the (much
+            # longer) compression steps. Only done when the operator sized
+            # max_ram themselves: with the 90%-of-RAM default, every step
+            # JVM, however small, would pre-fault nearly all memory and
+            # evict the page cache between steps
+            java_tool_options[:0] = ["-Xms{max_ram}", "-XX:+AlwaysPreTouch"]
+        conf["java_tool_options"] = " ".join(java_tool_options)
     conf["java_tool_options"] = conf["java_tool_options"].format(
         max_ram=conf["max_ram"]
     )
     if "java" not in conf:
         conf["java"] = "java"
+        # -XX:+UseNUMA only spreads the JVM heap; the page cache serving the
+        # huge on-disk batch files is still allocated on the faulting node.
+        # Interleaving the whole process avoids filling up a single NUMA
+        # node on multi-socket hosts (and is a no-op on single-node ones)
+        if shutil.which("numactl") is not None:
+            conf["java"] = "numactl --interleave=all " + conf["java"]
     if "classpath" not in conf:
         conf["classpath"] = find_graph_jar()
 
@@ -87,23 +134,26 @@ def check_config_compress(config, graph_name, in_dir, out_dir):
         tmp_dir = Path(conf["tmp_dir"])
     tmp_dir.mkdir(parents=True, exist_ok=True)
 
+    if "timing_log" not in conf:
+        conf["timing_log"] = str(out_dir / "timings.jsonl")
+
     if "logback" not in conf:
-        logback_confpath = tmp_dir / "logback.xml"
-        with open(logback_confpath, "w") as conffile:
-            conffile.write(
-                """
-<configuration>
-    <appender name="STDERR" class="ch.qos.logback.core.ConsoleAppender">
-        <encoder>
-            <pattern>%d %r %p [%t] %logger{1} - %m%n</pattern>
-        </encoder>
-        <target>System.err</target>
-    </appender>
-    <root level="INFO">
-        <appender-ref ref="STDERR"/>
-    </root>
-</configuration>
-"""
+        # the default logback.xml ships as package data; point the JVMs
+        # directly at it instead of rewriting a copy on every run
+        try:
+            respath = importlib.resources.files("swh.graph.data") / "logback.xml"
+        except AttributeError:  # python < 3.9
+            respath = None
+        if isinstance(respath, Path) and respath.is_file():
+            # package data materialized as a real file the JVM can open
+            logback_confpath = respath
+        else:
+            # python < 3.9, or package data not on the filesystem (e.g., a
+            # zip import, where files() returns a zipfile.Path the JVM
+            # cannot open): write a copy under tmp_dir, as before
+            logback_confpath = tmp_dir / "logback.xml"
+            logback_confpath.write_text(
+                importlib.resources.read_text("swh.graph.data", "logback.xml")
             )
         conf["logback"] = str(logback_confpath)
 
@@ -114,4 +164,11 @@ def check_config_compress(config, graph_name, in_dir, out_dir):
         tmp_dir=conf["tmp_dir"],
     )
 
+    # environment for the children spawned by the compression steps, built
+    # once here instead of copying os.environ again for every step
+    step_env = dict(os.environ)
+    step_env["JAVA_TOOL_OPTIONS"] = conf["java_tool_options"]
+    step_env["CLASSPATH"] = conf["classpath"]
+    conf["_step_env"] = step_env
+
     return conf
@@ -1,12 +1,44 @@
-# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+# Originally generated by the gRPC Python protocol compiler plugin, then
+# hand-compacted: the per-method stub/handler boilerplate is now derived from
+# the _METHODS table below. Re-apply this transformation after regenerating.
 """Client and server classes corresponding to protobuf-defined services."""
+from typing import List, Tuple, Type
+
+from google.protobuf.message import Message
 import grpc
 
 from swh.graph.rpc import swhgraph_pb2 as swh_dot_graph_dot_rpc_dot_swhgraph__pb2
 
+_pb2 = swh_dot_graph_dot_rpc_dot_swhgraph__pb2
+
+_SERVICE_NAME = 'swh.graph.TraversalService'
+
+# (method name, RPC kind, request class, response class) for every method of
+# TraversalService; everything below is built from this table, with the
+# (de)serializer bound methods resolved once here rather than on every stub
+# instantiation / server registration.
+_METHODS: List[Tuple[str, str, Type[Message], Type[Message]]] = [
+    ('GetNode', 'unary_unary', _pb2.GetNodeRequest, _pb2.Node),
+    ('Traverse', 'unary_stream', _pb2.TraversalRequest, _pb2.Node),
+    ('FindPathTo', 'unary_unary', _pb2.FindPathToRequest, _pb2.Path),
+    ('FindPathBetween', 'unary_unary', _pb2.FindPathBetweenRequest, _pb2.Path),
+    ('CountNodes', 'unary_unary', _pb2.TraversalRequest, _pb2.CountResponse),
+    ('CountEdges', 'unary_unary', _pb2.TraversalRequest, _pb2.CountResponse),
+    ('Stats', 'unary_unary', _pb2.StatsRequest, _pb2.StatsResponse),
+]
+
+# name -> (kind, request serializer, request deserializer,
+#          response serializer, response deserializer)
+_CODECS = {
+    name: (kind,
+           request.SerializeToString, request.FromString,
+           response.SerializeToString, response.FromString)
+    for (name, kind, request, response) in _METHODS
+}
+
 
 class TraversalServiceStub(object):
-    """Graph traversal service 
+    """Graph traversal service
     """
 
     def __init__(self, channel):
@@ -15,49 +47,20 @@ class TraversalServiceStub(object):
         Args:
             channel: A grpc.Channel.
         """
-        self.GetNode = channel.unary_unary(
-                '/swh.graph.TraversalService/GetNode',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.GetNodeRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.FromString,
-                )
-        self.Traverse = channel.unary_stream(
-                '/swh.graph.TraversalService/Traverse',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.FromString,
-                )
-        self.FindPathTo = channel.unary_unary(
-                '/swh.graph.TraversalService/FindPathTo',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathToRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.FromString,
-                )
-        self.FindPathBetween = channel.unary_unary(
-                '/swh.graph.TraversalService/FindPathBetween',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathBetweenRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.FromString,
-                )
-        self.CountNodes = channel.unary_unary(
-                '/swh.graph.TraversalService/CountNodes',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.FromString,
-                )
-        self.CountEdges = channel.unary_unary(
-                '/swh.graph.TraversalService/CountEdges',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.FromString,
-                )
-        self.Stats = channel.unary_unary(
-                '/swh.graph.TraversalService/Stats',
-                request_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsRequest.SerializeToString,
-                response_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsResponse.FromString,
-                )
+        for name, (kind, req_ser, _, _, resp_deser) in _CODECS.items():
+            setattr(self, name, getattr(channel, kind)(
+                    '/%s/%s' % (_SERVICE_NAME, name),
+                    request_serializer=req_ser,
+                    response_deserializer=resp_deser,
+                    ))
 
 
 class TraversalServiceServicer(object):
-    """Graph traversal service 
+    """Graph traversal service
     """
 
     def GetNode(self, request, context):
-        """GetNode returns a single Node and its properties. 
+        """GetNode returns a single Node and its properties.
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -113,7 +116,7 @@ class TraversalServiceServicer(object):
 
     def CountNodes(self, request, context):
         """CountNodes does the same as Traverse, but only returns the number of
-        nodes accessed during the traversal. 
+        nodes accessed during the traversal.
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -121,14 +124,14 @@ class TraversalServiceServicer(object):
 
     def CountEdges(self, request, context):
         """CountEdges does the same as Traverse, but only returns the number of
-        edges accessed during the traversal. 
+        edges accessed during the traversal.
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
     def Stats(self, request, context):
-        """Stats returns various statistics on the overall graph. 
+        """Stats returns various statistics on the overall graph.
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -137,71 +140,20 @@ class TraversalServiceServicer(object):
 
 def add_TraversalServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
-            'GetNode': grpc.unary_unary_rpc_method_handler(
-                    servicer.GetNode,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.GetNodeRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.SerializeToString,
-            ),
-            'Traverse': grpc.unary_stream_rpc_method_handler(
-                    servicer.Traverse,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.SerializeToString,
-            ),
-            'FindPathTo': grpc.unary_unary_rpc_method_handler(
-                    servicer.FindPathTo,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathToRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.SerializeToString,
-            ),
-            'FindPathBetween': grpc.unary_unary_rpc_method_handler(
-                    servicer.FindPathBetween,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathBetweenRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.SerializeToString,
-            ),
-            'CountNodes': grpc.unary_unary_rpc_method_handler(
-                    servicer.CountNodes,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.SerializeToString,
-            ),
-            'CountEdges': grpc.unary_unary_rpc_method_handler(
-                    servicer.CountEdges,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.SerializeToString,
-            ),
-            'Stats': grpc.unary_unary_rpc_method_handler(
-                    servicer.Stats,
-                    request_deserializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsRequest.FromString,
-                    response_serializer=swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsResponse.SerializeToString,
-            ),
+            name: getattr(grpc, '%s_rpc_method_handler' % kind)(
+                    getattr(servicer, name),
+                    request_deserializer=req_deser,
+                    response_serializer=resp_ser,
+            )
+            for name, (kind, _, req_deser, resp_ser, _) in _CODECS.items()
     }
     generic_handler = grpc.method_handlers_generic_handler(
-            'swh.graph.TraversalService', rpc_method_handlers)
+            _SERVICE_NAME, rpc_method_handlers)
     server.add_generic_rpc_handlers((generic_handler,))
 
 
- # This class is part of an EXPERIMENTAL API.
-class TraversalService(object):
-    """Graph traversal service 
-    """
-
-    @staticmethod
-    def GetNode(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/GetNode',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.GetNodeRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
-
-    @staticmethod
-    def Traverse(request,
+def _experimental_method(name, kind, req_ser, resp_deser):
+    def method(request,
             target,
             options=(),
             channel_credentials=None,
@@ -211,93 +163,24 @@ class TraversalService(object):
             wait_for_ready=None,
             timeout=None,
             metadata=None):
-        return grpc.experimental.unary_stream(request, target, '/swh.graph.TraversalService/Traverse',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Node.FromString,
+        return getattr(grpc.experimental, kind)(
+            request, target, '/%s/%s' % (_SERVICE_NAME, name),
+            req_ser,
+            resp_deser,
             options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+            insecure, call_credentials, compression, wait_for_ready, timeout,
+            metadata)
+    method.__name__ = method.__qualname__ = name
+    return staticmethod(method)
 
-    @staticmethod
-    def FindPathTo(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/FindPathTo',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathToRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
-    @staticmethod
-    def FindPathBetween(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/FindPathBetween',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.FindPathBetweenRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.Path.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+ # This class is part of an EXPERIMENTAL API.
+class TraversalService(object):
+    """Graph traversal service
+    """
 
-    @staticmethod
-    def CountNodes(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/CountNodes',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
-    @staticmethod
-    def CountEdges(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/CountEdges',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.TraversalRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.CountResponse.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
-
-    @staticmethod
-    def Stats(request,
-            target,
-            options=(),
-            channel_credentials=None,
-            call_credentials=None,
-            insecure=False,
-            compression=None,
-            wait_for_ready=None,
-            timeout=None,
-            metadata=None):
-        return grpc.experimental.unary_unary(request, target, '/swh.graph.TraversalService/Stats',
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsRequest.SerializeToString,
-            swh_dot_graph_dot_rpc_dot_swhgraph__pb2.StatsResponse.FromString,
-            options, channel_credentials,
-            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+for _name, (_kind, _req_ser, _req_deser, _resp_ser, _resp_deser) in _CODECS.items():
+    setattr(TraversalService, _name,
+            _experimental_method(_name, _kind, _req_ser, _resp_deser))
+del _name, _kind, _req_ser, _req_deser, _resp_ser, _resp_deser
@@ -0,0 +1,98 @@
+# Copyright (C) 2022  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import os
+
+from swh.graph import webgraph
+from swh.graph.webgraph import COMP_SEQ, CompressionStep, compress
+
+
+def _setup_fake_pipeline(monkeypatch, up_to_date):
+    """monkeypatch compress() collaborators so that the scheduling logic can
+    be exercised without a JVM; return the list of steps actually run"""
+    monkeypatch.setattr(
+        webgraph,
+        "check_config_compress",
+        lambda conf, graph_name, in_dir, out_dir: {"max_parallel_steps": 1, **conf},
+    )
+    monkeypatch.setattr(webgraph, "step_is_up_to_date", lambda step, conf: up_to_date)
+    steps_run = []
+    monkeypatch.setattr(webgraph, "do_step", lambda step, conf: steps_run.append(step))
+    return steps_run
+
+
+def test_compress_runs_steps_in_comp_seq_order(monkeypatch, tmp_path):
+    steps_run = _setup_fake_pipeline(monkeypatch, up_to_date=False)
+    compress("graph", tmp_path, tmp_path)
+    assert steps_run == COMP_SEQ
+
+
+def test_compress_rerun_up_to_date_is_noop(monkeypatch, tmp_path):
+    """re-running the pipeline when all outputs are already up to date skips
+    every step and returns, instead of misdiagnosing a dependency cycle"""
+    steps_run = _setup_fake_pipeline(monkeypatch, up_to_date=True)
+    compress("graph", tmp_path, tmp_path)
+    assert steps_run == []
+
+
+def test_compress_rerun_up_to_date_single_step(monkeypatch, tmp_path):
+    steps_run = _setup_fake_pipeline(monkeypatch, up_to_date=True)
+    compress("graph", tmp_path, tmp_path, steps={CompressionStep.MPH})
+    assert steps_run == []
+
+
+def test_compress_force_reruns_up_to_date_steps(monkeypatch, tmp_path):
+    steps_run = _setup_fake_pipeline(monkeypatch, up_to_date=True)
+    compress("graph", tmp_path, tmp_path, conf={"force": True})
+    assert steps_run == COMP_SEQ
+
+
+def _setup_extract_nodes_tree(tmp_path):
+    """lay out inputs and outputs of the EXTRACT_NODES step, with outputs
+    newer than the input dataset; return the conf and an input ORC file"""
+    in_dir = tmp_path / "in"
+    orc_file = in_dir / "orc" / "revision" / "rev.orc"
+    orc_file.parent.mkdir(parents=True)
+    orc_file.write_text("data")
+    # directory mtimes count as input mtimes too (they track file
+    # addition/removal), so date the whole input tree in the past
+    for path in (orc_file, orc_file.parent, orc_file.parent.parent, in_dir):
+        os.utime(path, (1000, 1000))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    for name in ("graph.nodes.csv.zst", "graph.labels.csv.zst"):
+        (out_dir / name).write_text("output")
+        os.utime(out_dir / name, (2000, 2000))
+    conf = {
+        "in_dir": str(in_dir),
+        "out_dir": str(out_dir),
+        "graph_name": "graph",
+    }
+    return conf, orc_file
+
+
+def test_step_is_up_to_date_recurses_into_input_dirs(tmp_path):
+    conf, orc_file = _setup_extract_nodes_tree(tmp_path)
+    step = CompressionStep.EXTRACT_NODES
+    assert webgraph.step_is_up_to_date(step, conf)
+    # rewriting a file nested below in_dir must invalidate the outputs, even
+    # though the mtime of in_dir itself does not change
+    os.utime(orc_file, (3000, 3000))
+    assert not webgraph.step_is_up_to_date(step, conf)
+
+
+def test_step_is_up_to_date_missing_output(tmp_path):
+    conf, _ = _setup_extract_nodes_tree(tmp_path)
+    (tmp_path / "out" / "graph.nodes.csv.zst").unlink()
+    assert not webgraph.step_is_up_to_date(CompressionStep.EXTRACT_NODES, conf)
+
+
+def test_step_is_up_to_date_partial_marker(tmp_path):
+    """a step that failed or was interrupted left its partial marker behind,
+    so its outputs must not be trusted, however fresh they look"""
+    conf, _ = _setup_extract_nodes_tree(tmp_path)
+    step = CompressionStep.EXTRACT_NODES
+    webgraph._partial_marker(step, conf).touch()
+    assert not webgraph.step_is_up_to_date(step, conf)
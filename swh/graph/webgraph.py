@@ -7,12 +7,17 @@
 
 """
 
+import concurrent.futures
 from datetime import datetime
 from enum import Enum
+import json
 import logging
 import os
 from pathlib import Path
+import resource
+import shutil
 import subprocess
+import threading
 from typing import Dict, List, Set
 
 from swh.graph.config import check_config_compress
@@ -53,11 +58,12 @@ class CompressionStep(Enum):
 # full compression pipeline
 COMP_SEQ = list(CompressionStep)
 
-# Mapping from compression steps to shell commands implementing them. Commands
-# will be executed by the shell, so be careful with meta characters. They are
-# specified here as lists of tokens that will be joined together only for ease
-# of line splitting. In commands, {tokens} will be interpolated with
-# configuration values, see :func:`compress`.
+# Mapping from compression steps to the commands implementing them, run
+# without any shell in between. Commands are given as lists of tokens; in each
+# token, {placeholders} are interpolated with configuration values (see
+# :func:`compress`), then the token is split on whitespace. A token of the
+# form "< path" is not a command argument, but redirects the command's
+# standard input from that path.
 STEP_ARGV: Dict[CompressionStep, List[str]] = {
     CompressionStep.EXTRACT_NODES: [
         "{java}",
@@ -245,28 +251,184 @@ STEP_ARGV: Dict[CompressionStep, List[str]] = {
         "--list",
         "{out_dir}/{graph_name}-transposed-labelled",
     ],
-    CompressionStep.CLEAN_TMP: [
-        "rm",
-        "-rf",
+}
+
+# Intermediate files removed by the CLEAN_TMP step, which is implemented
+# in-process by do_step rather than as a command; {placeholders} are
+# interpolated with configuration values, as in :data:`STEP_ARGV`.
+TMP_FILES: List[str] = [
+    "{out_dir}/{graph_name}-base.graph",
+    "{out_dir}/{graph_name}-base.offsets",
+    "{out_dir}/{graph_name}-base.properties",
+    "{out_dir}/{graph_name}-bfs-simplified.graph",
+    "{out_dir}/{graph_name}-bfs-simplified.offsets",
+    "{out_dir}/{graph_name}-bfs-simplified.properties",
+    "{out_dir}/{graph_name}-bfs-transposed.graph",
+    "{out_dir}/{graph_name}-bfs-transposed.offsets",
+    "{out_dir}/{graph_name}-bfs-transposed.properties",
+    "{out_dir}/{graph_name}-bfs.graph",
+    "{out_dir}/{graph_name}-bfs.offsets",
+    "{out_dir}/{graph_name}-bfs.order",
+    "{out_dir}/{graph_name}-bfs.properties",
+    "{out_dir}/{graph_name}-llp.order",
+]
+
+# Main input/output files of the compression steps, as path templates
+# interpolated like those of :data:`STEP_ARGV`. Used to detect steps whose
+# outputs are already up to date with respect to their inputs, so that they
+# can be skipped when re-running a pipeline (see :func:`step_is_up_to_date`).
+# Steps missing from either mapping (e.g., those producing many files or
+# none) are never skipped.
+STEP_INPUTS: Dict[CompressionStep, List[str]] = {
+    CompressionStep.EXTRACT_NODES: ["{in_dir}"],
+    CompressionStep.MPH: ["{out_dir}/{graph_name}.nodes.csv.zst"],
+    CompressionStep.BFS: ["{out_dir}/{graph_name}-base.graph"],
+    CompressionStep.PERMUTE_BFS: [
         "{out_dir}/{graph_name}-base.graph",
-        "{out_dir}/{graph_name}-base.offsets",
-        "{out_dir}/{graph_name}-base.properties",
-        "{out_dir}/{graph_name}-bfs-simplified.graph",
-        "{out_dir}/{graph_name}-bfs-simplified.offsets",
-        "{out_dir}/{graph_name}-bfs-simplified.properties",
+        "{out_dir}/{graph_name}-bfs.order",
+    ],
+    CompressionStep.TRANSPOSE_BFS: ["{out_dir}/{graph_name}-bfs.graph"],
+    CompressionStep.SIMPLIFY: [
+        "{out_dir}/{graph_name}-bfs.graph",
         "{out_dir}/{graph_name}-bfs-transposed.graph",
-        "{out_dir}/{graph_name}-bfs-transposed.offsets",
-        "{out_dir}/{graph_name}-bfs-transposed.properties",
+    ],
+    CompressionStep.LLP: ["{out_dir}/{graph_name}-bfs-simplified.graph"],
+    CompressionStep.PERMUTE_LLP: [
         "{out_dir}/{graph_name}-bfs.graph",
-        "{out_dir}/{graph_name}-bfs.offsets",
+        "{out_dir}/{graph_name}-llp.order",
+    ],
+    CompressionStep.OBL: ["{out_dir}/{graph_name}.graph"],
+    CompressionStep.COMPOSE_ORDERS: [
         "{out_dir}/{graph_name}-bfs.order",
-        "{out_dir}/{graph_name}-bfs.properties",
         "{out_dir}/{graph_name}-llp.order",
-        "{tmp_dir}",
     ],
+    CompressionStep.TRANSPOSE: ["{out_dir}/{graph_name}.graph"],
+    CompressionStep.TRANSPOSE_OBL: ["{out_dir}/{graph_name}-transposed.graph"],
+    CompressionStep.MAPS: [
+        "{out_dir}/{graph_name}.nodes.csv.zst",
+        "{out_dir}/{graph_name}.mph",
+        "{out_dir}/{graph_name}.order",
+    ],
+    CompressionStep.EXTRACT_PERSONS: ["{in_dir}"],
+    CompressionStep.MPH_PERSONS: ["{out_dir}/{graph_name}.persons.csv.zst"],
+    CompressionStep.MPH_LABELS: ["{out_dir}/{graph_name}.labels.csv.zst"],
+}
+
+STEP_OUTPUTS: Dict[CompressionStep, List[str]] = {
+    CompressionStep.EXTRACT_NODES: [
+        "{out_dir}/{graph_name}.nodes.csv.zst",
+        "{out_dir}/{graph_name}.labels.csv.zst",
+    ],
+    CompressionStep.MPH: ["{out_dir}/{graph_name}.mph"],
+    CompressionStep.BFS: ["{out_dir}/{graph_name}-bfs.order"],
+    CompressionStep.PERMUTE_BFS: ["{out_dir}/{graph_name}-bfs.graph"],
+    CompressionStep.TRANSPOSE_BFS: ["{out_dir}/{graph_name}-bfs-transposed.graph"],
+    CompressionStep.SIMPLIFY: ["{out_dir}/{graph_name}-bfs-simplified.graph"],
+    CompressionStep.LLP: ["{out_dir}/{graph_name}-llp.order"],
+    CompressionStep.PERMUTE_LLP: ["{out_dir}/{graph_name}.graph"],
+    CompressionStep.OBL: ["{out_dir}/{graph_name}.obl"],
+    CompressionStep.COMPOSE_ORDERS: ["{out_dir}/{graph_name}.order"],
+    CompressionStep.TRANSPOSE: ["{out_dir}/{graph_name}-transposed.graph"],
+    CompressionStep.TRANSPOSE_OBL: ["{out_dir}/{graph_name}-transposed.obl"],
+    CompressionStep.MAPS: ["{out_dir}/{graph_name}.node2swhid.bin"],
+    CompressionStep.EXTRACT_PERSONS: ["{out_dir}/{graph_name}.persons.csv.zst"],
+    CompressionStep.MPH_PERSONS: ["{out_dir}/{graph_name}.persons.mph"],
+    CompressionStep.MPH_LABELS: ["{out_dir}/{graph_name}.labels.mph"],
+}
+
+# Dependencies between compression steps: a step can only start once all its
+# dependencies (among the steps selected for the run) have completed. The
+# relation below is the DAG implied by the input/output files of the commands
+# in :data:`STEP_ARGV`; running steps in :data:`COMP_SEQ` order is one of its
+# topological sorts.
+STEP_DEPS: Dict[CompressionStep, Set[CompressionStep]] = {
+    CompressionStep.EXTRACT_NODES: set(),
+    CompressionStep.MPH: {CompressionStep.EXTRACT_NODES},
+    CompressionStep.BV: {CompressionStep.MPH},
+    CompressionStep.BFS: {CompressionStep.BV},
+    CompressionStep.PERMUTE_BFS: {CompressionStep.BFS},
+    CompressionStep.TRANSPOSE_BFS: {CompressionStep.PERMUTE_BFS},
+    CompressionStep.SIMPLIFY: {
+        CompressionStep.PERMUTE_BFS,
+        CompressionStep.TRANSPOSE_BFS,
+    },
+    CompressionStep.LLP: {CompressionStep.SIMPLIFY},
+    CompressionStep.PERMUTE_LLP: {CompressionStep.PERMUTE_BFS, CompressionStep.LLP},
+    CompressionStep.OBL: {CompressionStep.PERMUTE_LLP},
+    CompressionStep.COMPOSE_ORDERS: {CompressionStep.BFS, CompressionStep.LLP},
+    CompressionStep.STATS: {CompressionStep.OBL},
+    CompressionStep.TRANSPOSE: {CompressionStep.OBL},
+    CompressionStep.TRANSPOSE_OBL: {CompressionStep.TRANSPOSE},
+    CompressionStep.MAPS: {CompressionStep.MPH, CompressionStep.COMPOSE_ORDERS},
+    CompressionStep.EXTRACT_PERSONS: set(),
+    CompressionStep.MPH_PERSONS: {CompressionStep.EXTRACT_PERSONS},
+    CompressionStep.NODE_PROPERTIES: {
+        CompressionStep.MAPS,
+        CompressionStep.MPH_PERSONS,
+    },
+    CompressionStep.MPH_LABELS: {CompressionStep.EXTRACT_NODES},
+    CompressionStep.FCL_LABELS: {CompressionStep.MPH_LABELS},
+    CompressionStep.EDGE_LABELS: {
+        CompressionStep.MPH_LABELS,
+        CompressionStep.MAPS,
+        CompressionStep.OBL,
+        CompressionStep.TRANSPOSE_OBL,
+    },
+    CompressionStep.EDGE_LABELS_OBL: {CompressionStep.EDGE_LABELS},
+    CompressionStep.EDGE_LABELS_TRANSPOSE_OBL: {CompressionStep.EDGE_LABELS},
+    CompressionStep.CLEAN_TMP: set(CompressionStep) - {CompressionStep.CLEAN_TMP},
 }
 
 
+def _newest_mtime(path: str) -> float:
+    """newest mtime of a file, or of any file below a directory: a
+    directory's own mtime only tracks creation/removal of its direct
+    entries, not rewrites further down, so it cannot be trusted to tell
+    whether e.g. an ORC dataset changed"""
+    newest = os.stat(path).st_mtime
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            newest = max(newest, os.stat(os.path.join(dirpath, filename)).st_mtime)
+    return newest
+
+
+def _partial_marker(step, conf) -> Path:
+    """marker file recording that a compression step is running or has
+    failed; created before the step starts and removed only on success, so
+    its presence means the step's outputs cannot be trusted"""
+    return Path(conf["out_dir"]) / f".{str(step).lower()}.partial"
+
+
+def step_is_up_to_date(step, conf) -> bool:
+    """tell whether the outputs of a compression step already exist and are
+    newer than all its inputs, in which case running it again would only
+    reproduce them
+
+    Steps without input/output information (see :data:`STEP_INPUTS` and
+    :data:`STEP_OUTPUTS`) are never considered up to date, and neither are
+    steps whose last run failed or was interrupted (see
+    :func:`_partial_marker`): those may have left fresh-looking but
+    incomplete outputs behind.
+
+    """
+    inputs = STEP_INPUTS.get(step)
+    outputs = STEP_OUTPUTS.get(step)
+    if not inputs or not outputs:
+        return False
+    if _partial_marker(step, conf).exists():
+        return False
+    try:
+        newest_input = max(
+            _newest_mtime(template.format(**conf)) for template in inputs
+        )
+        oldest_output = min(
+            os.stat(template.format(**conf)).st_mtime for template in outputs
+        )
+    except FileNotFoundError:
+        return False
+    return oldest_output >= newest_input
+
+
 def do_step(step, conf):
     log_dir = Path(conf["out_dir"]) / "logs"
     log_dir.mkdir(exist_ok=True)
@@ -285,27 +447,25 @@ def do_step(step, conf):
     step_start_time = datetime.now()
     step_logger.info("Starting compression step %s at %s", step, step_start_time)
 
-    cmd = " ".join(STEP_ARGV[step]).format(**conf)
-    cmd_env = os.environ.copy()
-    cmd_env["JAVA_TOOL_OPTIONS"] = conf["java_tool_options"]
-    cmd_env["CLASSPATH"] = conf["classpath"]
-    process = subprocess.Popen(
-        ["/bin/bash", "-c", cmd],
-        env=cmd_env,
-        encoding="utf8",
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-    step_logger.info("Running: %s", cmd)
+    # mark the step as in progress; the marker is removed only on success,
+    # so that a failed or interrupted step is re-run rather than skipped as
+    # up to date on the next pipeline run
+    marker = _partial_marker(step, conf)
+    marker.touch()
 
-    with process.stdout as stdout:
-        for line in stdout:
-            step_logger.info(line.rstrip())
-    rc = process.wait()
+    ru_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if step == CompressionStep.CLEAN_TMP:
+        _clean_tmp(conf, step_logger)
+        rc = 0
+    else:
+        rc = _run_step_command(step, conf, step_logger)
     if rc != 0:
         raise RuntimeError(f"Compression step {step} returned non-zero exit code {rc}")
+    marker.unlink()
+    ru_after = resource.getrusage(resource.RUSAGE_CHILDREN)
     step_end_time = datetime.now()
     step_duration = step_end_time - step_start_time
+    _record_step_timing(step, conf, step_start_time, step_end_time, ru_before, ru_after)
     step_logger.info(
         "Compression step %s finished at %s (in %s)",
         step,
@@ -317,6 +477,134 @@ def do_step(step, conf):
     return rc
 
 
+_timing_log_lock = threading.Lock()
+
+
+def _record_step_timing(step, conf, start, end, ru_before, ru_after):
+    """append one JSON record for a completed compression step to the timing
+    log (the timing_log configuration key), for machine consumption; no-op
+    when no timing log is configured
+
+    The children_* fields come from process-wide RUSAGE_CHILDREN counters, so
+    they are only accurate per step for serial runs: with max_parallel_steps
+    > 1, children of other steps exiting in the same window contaminate the
+    CPU-time deltas, and max RSS is a high-water mark over all children.
+
+    """
+    timing_log = conf.get("timing_log")
+    if not timing_log:
+        return
+    record = {
+        "step": step.name,
+        "t_start": start.timestamp(),
+        "t_end": end.timestamp(),
+        "duration_s": (end - start).total_seconds(),
+        # per-step only for serial runs, see the docstring above
+        "children_user_s": ru_after.ru_utime - ru_before.ru_utime,
+        "children_sys_s": ru_after.ru_stime - ru_before.ru_stime,
+        # max RSS over all waited-for children so far, not a per-step delta
+        "children_maxrss_kb": ru_after.ru_maxrss,
+    }
+    with _timing_log_lock, open(timing_log, "a") as timing_file:
+        timing_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def _clean_tmp(conf, step_logger):
+    """remove the intermediate compression products (see :data:`TMP_FILES`)
+
+    The potentially huge tmp_dir tree is first renamed away, which makes the
+    removal O(1) from the pipeline's point of view, then deleted on a
+    background thread.
+
+    """
+    for template in TMP_FILES:
+        path = Path(template.format(**conf))
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    tmp_dir = Path(conf["tmp_dir"])
+    # doomed directories get a unique name, so that leftovers of a previous
+    # run killed in the middle of its background removal cannot make the
+    # rename fail with ENOTEMPTY; sweep up any such leftover as well
+    doomed_dirs = list(tmp_dir.parent.glob(tmp_dir.name + ".deleting-*"))
+    if tmp_dir.exists():
+        doomed_dir = tmp_dir.with_name(
+            f"{tmp_dir.name}.deleting-{int(datetime.now().timestamp() * 1000)}"
+        )
+        tmp_dir.rename(doomed_dir)
+        doomed_dirs.append(doomed_dir)
+    for doomed_dir in doomed_dirs:
+        step_logger.info("Removing %s in the background", doomed_dir)
+        threading.Thread(
+            target=shutil.rmtree,
+            args=(str(doomed_dir),),
+            kwargs={"ignore_errors": True},
+            name=f"clean-tmp-{doomed_dir.name}",
+        ).start()
+
+
+def _run_step_command(step, conf, step_logger):
+    """spawn the command implementing a compression step (see
+    :data:`STEP_ARGV`) and feed its output to the step logger; return the
+    command's exit code
+
+    """
+    argv: List[str] = []
+    stdin = None
+    for token in STEP_ARGV[step]:
+        token = token.format(**conf)
+        if token.startswith("< "):
+            stdin = open(token[2:], "rb")
+        else:
+            argv.extend(token.split())
+    cmd_env = conf.get("_step_env")
+    if cmd_env is None:  # conf not built by check_config_compress
+        cmd_env = os.environ.copy()
+        cmd_env["JAVA_TOOL_OPTIONS"] = conf["java_tool_options"]
+        cmd_env["CLASSPATH"] = conf["classpath"]
+    # Resolve argv[0] ourselves: CPython only takes its posix_spawn() fast
+    # path for absolute executable paths (bare names go through its own PATH
+    # search wrapped in fork()+exec()). Together with close_fds=False below,
+    # spawning a step avoids duplicating the driver's page tables (and,
+    # without memory overcommit, briefly reserving its full committed
+    # memory). close_fds=False leaks no descriptors opened by the driver,
+    # since Python fds are non-inheritable (PEP 446); descriptors the driver
+    # itself inherited are passed along, as they would be across a shell
+    executable = shutil.which(argv[0])
+    if executable is not None:
+        argv[0] = executable
+    process = subprocess.Popen(
+        argv,
+        env=cmd_env,
+        stdin=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        close_fds=False,
+    )
+    if stdin is not None:
+        stdin.close()  # the child owns its own copy of the file descriptor
+    step_logger.info("Running: %s", " ".join(argv))
+
+    # Pump the child's output in large chunks rather than line by line: JVM
+    # steps can emit millions of progress lines over several hours, and a
+    # per-line read/decode/log cycle is enough Python overhead to let the
+    # pipe fill up and throttle the child. Each log record holds the whole
+    # lines of one chunk.
+    with process.stdout as stdout:
+        tail = b""
+        while True:
+            chunk = os.read(stdout.fileno(), 1 << 16)
+            if not chunk:
+                break
+            (lines, _, tail) = (tail + chunk).rpartition(b"\n")
+            if lines:
+                step_logger.info(lines.decode("utf8", errors="replace"))
+        if tail:
+            step_logger.info(tail.decode("utf8", errors="replace"))
+    return process.wait()
+
+
 def compress(
     graph_name: str,
     in_dir: Path,
@@ -337,15 +625,35 @@ def compress(
 
           - batch_size: batch size for `WebGraph transformations
             <http://webgraph.di.unimi.it/docs/it/unimi/dsi/webgraph/Transform.html>`_;
-            defaults to 1 billion
+            defaults to 0.1% of ``max_ram``, clamped between 1 million and
+            2^30 - 1 arcs
           - classpath: java classpath, defaults to swh-graph JAR only
+          - force: run all selected steps, even those whose outputs are
+            already up to date with respect to their inputs (see
+            :func:`step_is_up_to_date`); defaults to False. Steps that
+            failed or were interrupted are re-run even without force, but
+            up-to-dateness is judged on mtimes only: outputs corrupted some
+            other way (e.g., truncated by hand or by a full disk) can still
+            look up to date, and need force to be rebuilt
           - java: command to run java VM, defaults to "java"
           - java_tool_options: value for JAVA_TOOL_OPTIONS environment
             variable; defaults to various settings for high memory machines
           - logback: path to a logback.xml configuration file; if not provided
             a temporary one will be created and used
-          - max_ram: maximum RAM to use for compression; defaults to available
-            virtual memory
+          - max_parallel_steps: maximum number of compression steps to run
+            concurrently; steps are scheduled according to their dependencies
+            (see :data:`STEP_DEPS`); defaults to 1, i.e., the steps run one
+            after the other in :data:`COMP_SEQ` order. Note that each
+            concurrent step spawns its own JVM, sized by ``max_ram``
+          - max_ram: maximum RAM to use for compression, as a number of bytes
+            or with a JVM-style K/M/G/T binary suffix (e.g., "200G");
+            defaults to available virtual memory, divided by
+            ``max_parallel_steps``
+          - timing_log: path of a JSON-lines file where one machine-readable
+            record per completed step is appended (start/end timestamps,
+            duration, children CPU times and max RSS; the latter are
+            per-step only when ``max_parallel_steps`` is 1); defaults to
+            "timings.jsonl" in out_dir
           - tmp_dir: temporary directory, defaults to the "tmp" subdir of
             out_dir
 
@@ -357,14 +665,52 @@ def compress(
 
     compression_start_time = datetime.now()
     logger.info("Starting compression at %s", compression_start_time)
-    seq_no = 0
     for step in COMP_SEQ:
         if step not in steps:
             logger.debug("Skipping compression step %s", step)
-            continue
-        seq_no += 1
-        logger.info("Running compression step %s (%s/%s)", step, seq_no, len(steps))
-        do_step(step, conf)
+
+    todo = [step for step in COMP_SEQ if step in steps]
+    done: Set[CompressionStep] = set()
+    running: Dict[concurrent.futures.Future, CompressionStep] = {}
+    max_workers = int(conf["max_parallel_steps"])
+    seq_no = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while todo or running:
+            for step in list(todo):
+                if len(running) >= max_workers:
+                    break
+                if any(dep in steps and dep not in done for dep in STEP_DEPS[step]):
+                    continue  # not ready yet
+                todo.remove(step)
+                seq_no += 1
+                if not conf.get("force") and step_is_up_to_date(step, conf):
+                    logger.info(
+                        "Skipping compression step %s (%s/%s): outputs are "
+                        "up to date",
+                        step,
+                        seq_no,
+                        len(steps),
+                    )
+                    done.add(step)
+                    continue
+                logger.info(
+                    "Running compression step %s (%s/%s)", step, seq_no, len(steps)
+                )
+                running[executor.submit(do_step, step, conf)] = step
+            if not running:
+                # everything ready was skipped as up to date; only complain
+                # if steps remain that can never become ready
+                if todo:
+                    raise RuntimeError(
+                        f"cyclic dependencies among compression steps {todo}"
+                    )
+                break
+            (completed, _) = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in completed:
+                done.add(running.pop(future))
+                future.result()  # reraise do_step failures
     compression_end_time = datetime.now()
     compression_duration = compression_end_time - compression_start_time
     logger.info("Completed compression in %s", compression_duration)